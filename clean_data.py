@@ -3,6 +3,41 @@ import os
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+# Low-cardinality text columns stored as 'category' to save memory and speed up merging
+CATEGORY_COLUMNS = [
+    'property_type', 'municipality_url', 'state_of_the_property', 'kitchen_equipment',
+    'type_of_heating', 'type_of_glazing', 'flooding_area_type',
+]
+
+
+def to_categories(df):
+    """Cast the known low-cardinality columns present in df to 'category' dtype."""
+    cols = [col for col in CATEGORY_COLUMNS if col in df.columns]
+    return df.astype({col: 'category' for col in cols})
+
+
+def read_csv(file_path):
+    """Read a CSV with the multithreaded pyarrow parser into the usual numpy dtypes."""
+    # Arrow-backed dtypes would make the merge fail on columns typed differently per file
+    try:
+        return pd.read_csv(file_path, engine='pyarrow')
+    except pd.errors.ParserError:
+        # pyarrow rejects short rows, which the C parser pads with NaN
+        return pd.read_csv(file_path, low_memory=False)
+
+
+def align_categories(df1, df2):
+    """Give the category columns of two column-aligned frames one shared set of categories."""
+    for col in df1.columns:
+        if isinstance(df1[col].dtype, pd.CategoricalDtype) or isinstance(df2[col].dtype, pd.CategoricalDtype):
+            categories = df1[col].astype('category').cat.categories.union(
+                df2[col].astype('category').cat.categories)
+            dtype = pd.CategoricalDtype(categories)
+            df1[col] = df1[col].astype(dtype)
+            df2[col] = df2[col].astype(dtype)
+    return df1, df2
+
+
 def combine_csv_files(file1_path, file2_path, output_path, type1_name='houses', type2_name='apartments'):
     """
     Combine two CSV files and add a 'property_type' column indicating the source.
@@ -14,21 +49,23 @@ def combine_csv_files(file1_path, file2_path, output_path, type1_name='houses',
     - type1_name: Name for the type column for file1 (default: 'houses')
     - type2_name: Name for the type column for file2 (default: 'apartments')
     """
-    df1 = pd.read_csv(file1_path, low_memory=False)
+    df1 = read_csv(file1_path)
     # Only set property_type if it's empty (NaN or doesn't exist)
     if 'property_type' not in df1.columns:
         df1['property_type'] = type1_name
     else:
         df1['property_type'] = df1['property_type'].fillna(type1_name)
+    df1 = to_categories(df1)
     print(f"  - Loaded {len(df1)} rows with type '{type1_name}' from {file1_path}")
     print(f"  - Columns in {type1_name}: {len(df1.columns)}")
 
-    df2 = pd.read_csv(file2_path, low_memory=False)
+    df2 = read_csv(file2_path)
     # Only set property_type if it's empty (NaN or doesn't exist)
     if 'property_type' not in df2.columns:
         df2['property_type'] = type2_name
     else:
         df2['property_type'] = df2['property_type'].fillna(type2_name)
+    df2 = to_categories(df2)
     print(f"  - Loaded {len(df2)} rows with type '{type2_name}' from {file2_path}")
     print(f"  - Columns in {type2_name}: {len(df2.columns)}")
 
@@ -44,28 +81,27 @@ def combine_csv_files(file1_path, file2_path, output_path, type1_name='houses',
     if cols_only_in_df2:
         print(f"    {sorted(cols_only_in_df2)[:5]}{'...' if len(cols_only_in_df2) > 5 else ''}")
 
-    # Add missing columns to both dataframes with NaN values
-    for col in cols_only_in_df1:
-        df2[col] = None
-    for col in cols_only_in_df2:
-        df1[col] = None
+    # Add missing columns to both dataframes with NaN values (one reindex each).
+    # They are kept as object, like the None columns they replace, so int columns
+    # from the other file are not upcast to float when the parts are concatenated
+    union_cols = df1.columns.union(df2.columns, sort=False)
+    df1 = df1.reindex(columns=union_cols).astype({col: object for col in cols_only_in_df2})
+    df2 = df2.reindex(columns=union_cols).astype({col: object for col in cols_only_in_df1})
+    df1, df2 = align_categories(df1, df2)
 
     # Sort columns by number of non-null values (most data first)
     # property_id always comes first
     print("\nSorting columns by data completeness...")
 
-    # Combine both dataframes temporarily to count non-null values across all data
-    temp_combined = pd.concat([df1, df2], ignore_index=True)
-
-    # Count non-null values for each column
-    non_null_counts = temp_combined.notna().sum().to_dict()
+    # Count non-null values for each column per frame and add them up,
+    # instead of concatenating both frames just to count
+    total_rows = len(df1) + len(df2)
+    non_null_counts = df1.notna().sum().add(df2.notna().sum(), fill_value=0)
 
-    # Remove property_id from the dict (we'll add it first manually)
-    if 'property_id' in non_null_counts:
-        del non_null_counts['property_id']
-
-    # Sort columns by non-null count (descending)
-    sorted_cols = sorted(non_null_counts.items(), key=lambda x: x[1], reverse=True)
+    # Sort columns by non-null count (descending); property_id is added first manually
+    non_null_counts = non_null_counts.drop('property_id', errors='ignore')
+    non_null_counts = non_null_counts.sort_values(ascending=False, kind='stable')
+    sorted_cols = list(non_null_counts.items())
 
     # Create final column order: property_id first, then sorted by completeness
     all_columns = ['property_id'] + [col for col, _ in sorted_cols]
@@ -75,16 +111,16 @@ def combine_csv_files(file1_path, file2_path, output_path, type1_name='houses',
 
     print(f"  - Columns sorted by completeness (top 10):")
     for i, (col, count) in enumerate(sorted_cols[:10]):
-        percentage = (count / len(temp_combined)) * 100
+        percentage = (count / total_rows) * 100
         print(f"    {i+2}. {col}: {count} ({percentage:.1f}%)")
 
-    # First, separate properties that exist in both files vs unique to each file
-    df1_ids = set(df1['property_id'])
-    df2_ids = set(df2['property_id'])
+    # Compare the ID sets with pandas Index algebra (C hashtable, no Python sets)
+    df1_ids = pd.Index(df1['property_id']).unique()
+    df2_ids = pd.Index(df2['property_id']).unique()
 
-    common_ids = df1_ids & df2_ids
-    unique_to_df1 = df1_ids - df2_ids
-    unique_to_df2 = df2_ids - df1_ids
+    common_ids = df1_ids.intersection(df2_ids)
+    unique_to_df1 = df1_ids.difference(df2_ids)
+    unique_to_df2 = df2_ids.difference(df1_ids)
 
     print(f"  - Properties in {type1_name}: {len(df1_ids)}")
     print(f"  - Properties in {type2_name}: {len(df2_ids)}")
@@ -92,28 +128,22 @@ def combine_csv_files(file1_path, file2_path, output_path, type1_name='houses',
     print(f"  - Unique to {type1_name}: {len(unique_to_df1)}")
     print(f"  - Unique to {type2_name}: {len(unique_to_df2)}")
 
-    # Get unique properties from each file
-    df1_unique = df1[df1['property_id'].isin(unique_to_df1)].copy()
-    df2_unique = df2[df2['property_id'].isin(unique_to_df2)].copy()
+    # Rows of IDs found in only one file are kept as they are, in file order
+    df1_in_common = df1['property_id'].isin(common_ids)
+    df2_in_common = df2['property_id'].isin(common_ids)
+    df1_unique = df1[~df1_in_common]
+    df2_unique = df2[~df2_in_common]
 
-    # For common properties, merge with df2 values taking precedence for non-null values
+    # For common properties, df1 values win where non-null and df2 fills the gaps.
+    # combine_first upcasts columns typed differently in the two files (int vs
+    # float or text), where fillna would have to cast df2's values into df1's dtype
     if len(common_ids) > 0:
-        df1_common = df1[df1['property_id'].isin(common_ids)].copy()
-        df2_common = df2[df2['property_id'].isin(common_ids)].copy()
-
-        # Set property_id as index for smart merging
-        df1_common = df1_common.set_index('property_id')
-        df2_common = df2_common.set_index('property_id')
-
-        # Update df1_common with non-null values from df2_common
-        # This fills NaN values in df1 with values from df2
-        df1_common = df1_common.combine_first(df2_common)
-        df1_common = df1_common.reset_index()
+        df1_common = df1[df1_in_common].set_index('property_id')
+        df2_common = df2[df2_in_common].set_index('property_id')
+        df1_common = df1_common.combine_first(df2_common).reset_index()
 
-        # Combine all parts
         combined_df = pd.concat([df1_unique, df2_unique, df1_common], ignore_index=True)
     else:
-        # No common properties, just concat unique ones
         combined_df = pd.concat([df1_unique, df2_unique], ignore_index=True)
 
     print(f"  - Total properties after merge: {len(combined_df)}")
@@ -1,7 +1,3 @@
-import scrapy
-
-class PropertyItem(scrapy.Item):
-    """Dynamic Scrapy Item that accepts any field."""
-    def __setitem__(self, key, value):
-        self.fields.setdefault(key, scrapy.Field())
-        super().__setitem__(key, value)
+class PropertyItem(dict):
+    """Dynamic item that accepts any field."""
+    __slots__ = ()
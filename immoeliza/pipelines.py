@@ -6,17 +6,81 @@
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+import io
 import re
 from scrapy.exporters import CsvItemExporter
 
 
+# Patterns used by the cleaners, compiled once at import
+NUMBER_RE = re.compile(r'[\d\s,]+')
+
+# Lower-cased strings the site uses to say "no data"
+EMPTY_VALUES = frozenset({
+    '',
+    '(information not available)',
+    'not applicable',
+    'no certificate',
+    'area info not available',
+})
+
+# Lower-cased Yes/No spellings and the binary value they stand for
+BINARY_VALUES = {
+    'yes': 1, 'y': 1, 'true': 1, '1': 1,
+    'no': 0, 'n': 0, 'false': 0, '0': 0,
+}
+
+
+def extract_number(value_str):
+    """
+    Return the first run of digits in value_str as an int (e.g. '1 200 m²' -> 1200).
+
+    Spaces and commas inside the run are dropped; a run that int() still
+    rejects gives None. The run never contains a '.', so there is no float case.
+    """
+    match = NUMBER_RE.search(value_str)
+    if match is None:
+        return None
+
+    try:
+        return int(match[0].replace(' ', '').replace(',', ''))
+    except ValueError:
+        return None
+
+
 class DataCleaningPipeline:
     """
     Pipeline to clean scraped data before storage.
     Uses pattern matching to dynamically identify and clean field types.
     """
 
+    # Fields the spiders build from the URL; kept as text whatever they contain
+    TEXT_FIELDS = frozenset({'url', 'property_id', 'municipality_url'})
+
+    # Field names with a fixed cleaner, regardless of naming patterns
+    CURRENCY_FIELDS = frozenset({'price', 'cadastral_income'})
+    AREA_FIELDS = frozenset({'garden', 'terrace', 'total_land_surface', 'livable_surface'})
+    INTEGER_FIELDS = frozenset({'build_year', 'postal_code', 'year_of_construction'})
+
+    # Substrings of field names that hold Yes/No values
+    BINARY_KEYWORDS = [
+        'furnished', 'attic', 'garage', 'elevator', 'vat', 'leased',
+        'water', 'preemption', 'cellar', 'diningroom', 'swimming_pool',
+        'pool', 'disabled', 'sewer', 'gas', 'permission', 'granted',
+        'connection', 'alarm', 'parking'
+    ]
+    BINARY_KEYWORDS_RE = re.compile('|'.join(map(re.escape, BINARY_KEYWORDS)))
+
+    def __init__(self):
+        # field name -> (rank, cleaner) chosen by the name alone, filled on first sight
+        self._field_routes = {}
+
     def process_item(self, item, spider):
+        # PropertyItem is a dict: clean values in place, skipping the adapter layer
+        if isinstance(item, dict):
+            for field, value in item.items():
+                item[field] = self._smart_clean(field, value)
+            return item
+
         adapter = ItemAdapter(item)
 
         # Clean each field dynamically based on content and field name
@@ -29,156 +93,116 @@ class DataCleaningPipeline:
 
         return item
 
+    def _route_field(self, field_name):
+        """
+        Return the (rank, cleaner) pair implied by the field name alone.
+
+        Ranks follow the priority order of _smart_clean, so content detection
+        only overrides the name when it ranks higher (lower number).
+        """
+        route = self._field_routes.get(field_name)
+        if route is not None:
+            return route
+
+        field_lower = field_name.lower()
+        if field_lower in self.TEXT_FIELDS:
+            # Outranks every content check, so values pass through untouched
+            route = (0, self._clean_empty)
+        elif field_lower in self.CURRENCY_FIELDS:
+            route = (1, self._clean_currency)
+        elif 'surface' in field_lower or field_lower in self.AREA_FIELDS:
+            route = (2, self._clean_area)
+        elif 'energy' in field_lower or 'consumption' in field_lower:
+            route = (3, self._clean_energy)
+        elif field_lower.startswith('number_') or field_lower in self.INTEGER_FIELDS:
+            route = (4, self._clean_integer)
+        elif self.BINARY_KEYWORDS_RE.search(field_lower):
+            route = (6, self._clean_binary)
+        else:
+            route = (7, self._clean_empty)
+
+        self._field_routes[field_name] = route
+        return route
+
     def _smart_clean(self, field_name, value):
         """
         Intelligently determine how to clean a field based on its name and value.
 
-        Priority order:
-        1. Detect by value content (has €, has m², has kWh, etc.)
-        2. Detect by field name patterns (starts with 'number_', contains 'surface', etc.)
-        3. Default to empty value cleaning
+        Priority order (each step by value content or by field name):
+        0. Text fields built by the spiders (url, property_id, ...) stay as-is
+        1. Currency (has € or $, or price/cadastral_income)
+        2. Area (has m², or surface-like field name)
+        3. Energy (has kWh, or energy/consumption field name)
+        4. Integer (number_* field names, build_year, postal_code, ...)
+        5. Binary by value (looks like Yes/No)
+        6. Binary by field name keyword (garage, elevator, ...)
+        7. Default to empty value cleaning
         """
-        if not value or value == '':
+        value_str, value_lower = self._prep(value)
+        if value_str is None:
             return None
 
-        value_str = str(value).strip()
-        field_lower = field_name.lower()
+        rank, field_cleaner = self._route_field(field_name)
 
-        # 1. CURRENCY DETECTION (by content: contains € or $ symbol)
-        if '€' in value_str or '$' in value_str or field_lower in ['price', 'cadastral_income']:
+        # Content checks only run for steps that outrank the field-name route
+        if rank > 1 and ('€' in value_str or '$' in value_str):
             return self._clean_currency(value_str)
 
-        # 2. AREA/SURFACE DETECTION (by content: contains m² OR field name patterns)
-        if 'm²' in value_str or 'm2' in value_str or \
-           'surface' in field_lower or \
-           field_lower in ['garden', 'terrace', 'total_land_surface', 'livable_surface']:
+        if rank > 2 and ('m²' in value_str or 'm2' in value_str):
             return self._clean_area(value_str)
 
-        # 3. ENERGY DETECTION (by content: contains kWh)
-        if 'kwh' in value_str.lower() or 'energy' in field_lower or 'consumption' in field_lower:
+        if rank > 3 and 'kwh' in value_lower:
             return self._clean_energy(value_str)
 
-        # 4. INTEGER/COUNT DETECTION (by field name: starts with 'number_' or is build_year/postal_code)
-        if field_lower.startswith('number_') or \
-           field_lower in ['build_year', 'postal_code', 'year_of_construction']:
-            return self._clean_integer(value_str)
-
-        # 5. BINARY DETECTION (by value content: Yes/No or by field name patterns)
-        # Check if value looks like Yes/No first
-        if self._looks_like_binary(value_str):
-            return self._clean_binary(value_str)
-
-        # Or if field name suggests binary
-        binary_keywords = [
-            'furnished', 'attic', 'garage', 'elevator', 'vat', 'leased',
-            'water', 'preemption', 'cellar', 'diningroom', 'swimming_pool',
-            'pool', 'disabled', 'sewer', 'gas', 'permission', 'granted',
-            'connection', 'alarm', 'parking'
-        ]
-        if any(keyword in field_lower for keyword in binary_keywords):
-            return self._clean_binary(value_str)
-
-        # 6. DEFAULT: Clean empty representations, otherwise keep as-is
-        return self._clean_empty(value_str)
-
-    def _looks_like_binary(self, value_str):
-        """Check if value looks like a Yes/No or binary response"""
-        v = value_str.lower().strip()
-        binary_values = ['yes', 'no', 'y', 'n', 'true', 'false', '0', '1']
-        return v in binary_values
-
-    def _clean_binary(self, value):
-        """Convert Yes/No to 1/0, handle empty values"""
-        if not value or value == '':
-            return None
+        # Looks like Yes/No: reuse the lower-cased copy instead of _clean_binary
+        if rank > 5 and value_lower in BINARY_VALUES:
+            return BINARY_VALUES[value_lower]
 
-        value_str = str(value).strip().lower()
+        return field_cleaner(value_str)
 
-        if value_str in ['yes', 'y', '1', 'true']:
-            return 1
-        elif value_str in ['no', 'n', '0', 'false']:
-            return 0
-        elif value_str == '(information not available)' or value_str == 'not applicable':
-            return None
-        else:
-            return None
+    def _prep(self, value):
+        """
+        Return (stripped, lower-cased) string forms of value, or (None, None)
+        when it holds no data.
 
-    def _clean_area(self, value):
-        """Extract numeric value from area strings (e.g., '144 m²' -> 144)"""
-        if not value or value == '':
-            return None
+        Empty values and the site's "no data" sentinels are caught once here,
+        so the _clean_* methods below always receive a non-empty stripped string,
+        and the lower-cased copy is made only once per value.
+        """
+        if not value:
+            return None, None
 
-        value_str = str(value).strip()
+        value_str = value.strip() if isinstance(value, str) else str(value).strip()
+        value_lower = value_str.lower()
+        if value_lower in EMPTY_VALUES:
+            return None, None
 
-        # Check for unavailable info
-        if value_str in ['(information not available)', 'Not applicable', '']:
-            return None
+        return value_str, value_lower
 
-        # Extract number using regex
-        match = re.search(r'([\d\s,]+)', value_str)
-        if match:
-            # Remove spaces and convert
-            number_str = match.group(1).replace(' ', '').replace(',', '')
-            try:
-                return float(number_str) if '.' in number_str else int(number_str)
-            except ValueError:
-                return None
+    def _clean_binary(self, value_str):
+        """Convert Yes/No to 1/0, anything else to None"""
+        return BINARY_VALUES.get(value_str.lower())
 
-        return None
+    def _clean_area(self, value_str):
+        """Extract numeric value from area strings (e.g., '144 m²' -> 144)"""
+        return extract_number(value_str)
 
-    def _clean_energy(self, value):
+    def _clean_energy(self, value_str):
         """Extract numeric value from energy strings (e.g., '629 kWh/m²/year' -> 629)"""
-        if not value or value == '':
-            return None
-
-        value_str = str(value).strip()
-
-        # Check for unavailable info
-        if value_str in ['(information not available)', 'Not applicable', '']:
-            return None
-
-        # Extract number using regex
-        match = re.search(r'([\d\s,]+)', value_str)
-        if match:
-            # Remove spaces and convert
-            number_str = match.group(1).replace(' ', '').replace(',', '')
-            try:
-                return float(number_str) if '.' in number_str else int(number_str)
-            except ValueError:
-                return None
-
-        return None
+        return extract_number(value_str)
 
-    def _clean_currency(self, value):
+    def _clean_currency(self, value_str):
         """Extract numeric value from currency strings (e.g., '245 000 €' -> 245000)"""
-        if not value or value == '':
-            return None
-
-        value_str = str(value).strip()
-
-        # Check for unavailable info
-        if value_str in ['(information not available)', 'Not applicable', '']:
-            return None
-
-        # Remove currency symbols and spaces
-        cleaned = re.sub(r'[€$\s]', '', value_str)
+        # Remove currency symbols and all whitespace (same set as the regex \s)
+        cleaned = ''.join(value_str.replace('€', '').replace('$', '').split())
 
         try:
             return int(cleaned)
         except ValueError:
             return None
 
-    def _clean_integer(self, value):
-        """Convert to integer, handle empty values"""
-        if not value or value == '':
-            return None
-
-        value_str = str(value).strip()
-
-        # Check for unavailable info
-        if value_str in ['(information not available)', 'Not applicable', '']:
-            return None
-
+    def _clean_integer(self, value_str):
+        """Convert to integer, None if it is not a whole number"""
         try:
             # Remove any spaces or commas
             cleaned = value_str.replace(' ', '').replace(',', '')
@@ -186,34 +210,35 @@ class DataCleaningPipeline:
         except ValueError:
             return None
 
-    def _clean_empty(self, value):
-        """Convert various empty representations to None"""
-        if not value or value == '':
-            return None
+    def _clean_empty(self, value_str):
+        """Keep text values as-is; empty representations were already mapped to None"""
+        return value_str
 
-        value_str = str(value).strip()
 
-        # List of strings that represent "no data"
-        empty_values = [
-            '(information not available)',
-            'not applicable',
-            'no certificate',
-            'area info not available',
-            ''
-        ]
+class ImmoelizaPipeline:
+    def process_item(self, item, spider):
+        return item
 
-        if value_str.lower() in empty_values:
-            return None
 
-        return value
+class BufferedCsvItemExporter(CsvItemExporter):
+    """
+    CSV exporter that batches rows in a 1 MiB buffer before they reach the
+    feed file, so the file sees a few large writes instead of one per row.
+    """
+    buffer_size = 1 << 20
 
+    def __init__(self, file, *args, **kwargs):
+        self._buffer = io.BufferedWriter(file, buffer_size=self.buffer_size)
+        super().__init__(self._buffer, *args, **kwargs)
 
-class ImmoelizaPipeline:
-    def process_item(self, item, spider):
-        return item
+    def finish_exporting(self):
+        # The parent detaches its text stream; flush and detach the buffer as
+        # well so the feed storage, not this exporter, closes the file
+        super().finish_exporting()
+        self._buffer.detach()
 
 
-class NoneAwareCsvItemExporter(CsvItemExporter):
+class NoneAwareCsvItemExporter(BufferedCsvItemExporter):
     """
     Custom CSV exporter that writes 'None' as text instead of empty strings
     for fields that have None values.
@@ -225,4 +250,7 @@ class NoneAwareCsvItemExporter(CsvItemExporter):
         """Override to write 'None' for None values instead of empty string"""
         if value is None:
             return 'None'
+        # Plain strings with no custom serializer pass through unchanged
+        if type(value) is str and not field:
+            return value
         return super().serialize_field(field, name, value)
@@ -1,12 +1,16 @@
+import os
 import re
 import json
 import time
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 
 import scrapy
-from scrapy.exporters import CsvItemExporter
+from lxml import etree
+from parsel.csstranslator import css2xpath
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 from scrapy_playwright.page import PageMethod
 from immoeliza.items import PropertyItem
+from immoeliza.pipelines import BufferedCsvItemExporter
 
 # ---------- optional tqdm ------------
 try:
@@ -15,25 +19,82 @@ except ImportError:
     tqdm = None
 
 
+# -------- Precompiled patterns ----------
+NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+# Detail-page queries: the spider's CSS selectors translated once with parsel's
+# own translator and compiled, instead of re-compiled on every row of every page
+FINANCIAL_SECTION_XPATH = etree.XPath(css2xpath("div.financial"))
+FINANCIAL_ROWS_XPATH = etree.XPath(css2xpath("li"))
+FINANCIAL_LABEL_XPATH = etree.XPath(css2xpath("strong::text"), smart_strings=False)
+ROW_TEXT_XPATH = etree.XPath("normalize-space(string())", smart_strings=False)
+GENERAL_SECTION_XPATH = etree.XPath(css2xpath("div.general-info"))
+GENERAL_ROWS_XPATH = etree.XPath(css2xpath("div.data-row div.data-row-wrapper > div"))
+GENERAL_LABEL_XPATH = etree.XPath(css2xpath("h4::text"), smart_strings=False)
+GENERAL_VALUE_XPATH = etree.XPath(css2xpath("p::text"), smart_strings=False)
+PRICE_XPATH = etree.XPath(css2xpath("div.detail-price::text"), smart_strings=False)
+TITLE_XPATH = etree.XPath(css2xpath("div.detail-title h1::text"), smart_strings=False)
+# Listing-page query: only the anchors that point at a detail page
+DETAIL_HREF_XPATH = etree.XPath(css2xpath('a[href*="/en/detail/"]::attr(href)'), smart_strings=False)
+
+
 # -------- Dynamic CSV exporter ----------
-class DynamicCsvItemExporter(CsvItemExporter):
+class DynamicCsvItemExporter(BufferedCsvItemExporter):
     def _write_headers_and_set_fields_to_export(self, item):
         if not self.fields_to_export:
             self.fields_to_export = list(item.keys())
         super()._write_headers_and_set_fields_to_export(item)
 
+    def export_item(self, item):
+        # Dict items are written straight from the header's field order,
+        # skipping the per-field serialize_field/_build_row round trip
+        if not isinstance(item, dict):
+            return super().export_item(item)
+        if self._headers_not_written:
+            self._headers_not_written = False
+            self._write_headers_and_set_fields_to_export(item)
+        row = [item.get(name, "") for name in self.fields_to_export]
+        self.csv_writer.writerow(["None" if value is None else value for value in row])
+
     def serialize_field(self, field, name, value):
         """Override to write 'None' for None values instead of empty string"""
         if value is None:
             return 'None'
+        # Plain strings with no custom serializer pass through unchanged
+        if type(value) is str and not field:
+            return value
         return super().serialize_field(field, name, value)
 
 
 # -------- Abort heavy requests ----------
+BLOCKED_RESOURCE_TYPES = frozenset({
+    "image", "font", "media", "stylesheet", "other", "manifest", "eventsource", "websocket",
+})
+
+
+# Third-party trackers the detail sections never depend on
+BLOCKED_HOSTS = ("doubleclick.net", "googletagmanager.com", "google-analytics.com", "hotjar.com", "facebook.net")
+BLOCKED_HOST_SUFFIXES = tuple(f".{host}" for host in BLOCKED_HOSTS)
+
+
 async def abort_request(request):
-    if request.resource_type in ["image", "font", "media", "other"]:
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
         return True
-    return False
+    # Match the host only, so first-party URLs that mention a tracker are kept
+    host = urlparse(request.url).hostname or ""
+    return host in BLOCKED_HOSTS or host.endswith(BLOCKED_HOST_SUFFIXES)
+
+
+# -------- Wait for rendered detail sections ----------
+async def wait_for_detail_sections(page, timeout=5000):
+    """Return as soon as both data sections are rendered, or quietly after timeout."""
+    try:
+        await page.wait_for_function(
+            "() => document.querySelector('div.financial') && document.querySelector('div.general-info')",
+            timeout=timeout,
+        )
+    except PlaywrightTimeoutError:
+        pass
 
 
 # =====================================================
@@ -75,14 +136,30 @@ class ImmovlanHousesByMunicipalitySpider(scrapy.Spider):
             "detail_requests_sent": 0,
             "items_exported": 0,
         }
-        self._seen_details = set()
+        # Raw label -> column name; the same few dozen labels repeat on every page
+        self._norm_cache = {}
 
     # ------------ optimized settings ------------
     custom_settings = {
         "ROBOTSTXT_OBEY": False,
-        "CONCURRENT_REQUESTS": 20,
+        # Every request goes to immovlan.be, so the per-domain limit is the real one
+        "CONCURRENT_REQUESTS": 16,
         "CONCURRENT_REQUESTS_PER_DOMAIN": 16,
         "DOWNLOAD_DELAY": 0.05,
+        "DOWNLOAD_TIMEOUT": 30,
+        "DNSCACHE_ENABLED": True,
+        "DNS_TIMEOUT": 10,
+        "SCHEDULER_PRIORITY_QUEUE": "scrapy.pqueues.DownloaderAwarePriorityQueue",
+        # Pages are public and the consent banner is handled in the browser;
+        # no cookie jar needed for the static requests
+        "COOKIES_ENABLED": False,
+        # Let AutoThrottle settle on the rate the site sustains, and stop runs
+        # that only produce errors instead of retrying through every page
+        "AUTOTHROTTLE_ENABLED": True,
+        "AUTOTHROTTLE_START_DELAY": 0.25,
+        "AUTOTHROTTLE_MAX_DELAY": 5,
+        "AUTOTHROTTLE_TARGET_CONCURRENCY": 12,
+        "CLOSESPIDER_ERRORCOUNT": 200,
 
         "FEED_EXPORTERS": {
             "dynamic_csv": "immoeliza.spiders.immovlan_houses_by_municipality.DynamicCsvItemExporter",
@@ -99,6 +176,10 @@ class ImmovlanHousesByMunicipalitySpider(scrapy.Spider):
         "TWISTED_REACTOR": "twisted.internet.asyncioreactor.AsyncioSelectorReactor",
         "PLAYWRIGHT_BROWSER_TYPE": "chromium",
         "PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT": 20000,
+        # Rendering is only a fallback: one shared context, and a cap on open
+        # Chromium pages instead of letting them grow with CONCURRENT_REQUESTS
+        "PLAYWRIGHT_MAX_CONTEXTS": 1,
+        "PLAYWRIGHT_MAX_PAGES_PER_CONTEXT": 8,
         "PLAYWRIGHT_LAUNCH_OPTIONS": {
             "headless": True,
             "args": [
@@ -122,53 +203,76 @@ class ImmovlanHousesByMunicipalitySpider(scrapy.Spider):
     }
 
     # ------------ lifecycle ------------
-    def open_spider(self, spider):
-        self.t0 = time.monotonic()
-
-    def close_spider(self, spider):
+    def closed(self, reason):
         elapsed = time.monotonic() - self.t0 if self.t0 else None
         self.metrics["elapsed_seconds"] = round(elapsed or 0.0, 2)
-        metrics_path = "data/metrics_immo_houses_by_municipality.json"
+        metrics_path = f"data/metrics_{self.name}.json"
         try:
-            with open(metrics_path, "w", encoding="utf-8") as f:
-                json.dump(self.metrics, f, ensure_ascii=False, indent=2)
+            # Write aside and swap in, so a killed run never leaves a half-written file behind
+            tmp_path = f"{metrics_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(self.metrics, ensure_ascii=False, indent=2))
+            os.replace(tmp_path, metrics_path)
             self.logger.info(f"Metrics written → {metrics_path}: {self.metrics}")
         except Exception as e:
             self.logger.warning(f"Failed to write metrics: {e}")
 
     # ------------ start: by municipality + pages ------------
     def start_requests(self):
-        iterator = tqdm(self.municipalities, desc="Municipalities") if tqdm else self.municipalities
+        self.t0 = time.monotonic()
+        iterator = tqdm(self.municipalities, desc="Municipalities", mininterval=1.0) if tqdm else self.municipalities
 
+        # Only page 1 up front; parse_listing follows the pagination while pages have results
         for municipal in iterator:
-            for page in range(1, self.max_pages + 1):
-                url = self.base_search.format(municipal=municipal, page=page)
-                self.metrics["listing_pages_requested"] += 1
-                yield scrapy.Request(url, callback=self.parse_listing, meta={"municipal": municipal, "page": page})
+            yield self._listing_request(municipal, 1)
+
+    def _listing_request(self, municipal, page, after_failure=False):
+        url = self.base_search.format(municipal=municipal, page=page)
+        self.metrics["listing_pages_requested"] += 1
+        return scrapy.Request(
+            url,
+            callback=self.parse_listing,
+            errback=self.listing_failed,
+            meta={"municipal": municipal, "page": page, "after_failure": after_failure},
+        )
+
+    def listing_failed(self, failure):
+        # Pages are chained from each listing response, so a failed page would end the chain
+        municipal = failure.request.meta.get("municipal")
+        page = failure.request.meta.get("page", 1)
+        if failure.request.meta.get("after_failure") or page >= self.max_pages:
+            self.logger.warning(f"Pagination stopped for {municipal} at page {page}: {failure.value!r}")
+            return
+        # Skip the failed page once; a second failure in a row ends the municipality
+        self.logger.warning(f"Listing page {page} failed for {municipal}, trying page {page + 1}: {failure.value!r}")
+        yield self._listing_request(municipal, page + 1, after_failure=True)
 
     # ------------ parse listing ------------
     def parse_listing(self, response):
         municipal = response.meta.get("municipal")
-        hrefs = response.css("a::attr(href)").getall()
-        detail_paths = [h for h in hrefs if re.search(r"/en/detail/", h or "")]
-        iterator = tqdm(detail_paths, desc=f"{municipal} page={response.meta.get('page')}") if tqdm else detail_paths
+        # A card links to its detail page more than once; keep the first, in page order
+        detail_paths = list(dict.fromkeys(DETAIL_HREF_XPATH(response.selector.root)))
 
-        for href in iterator:
+        sent = 0
+        for href in detail_paths:
             abs_url = urljoin(response.url, href)
-            if "immovlan.be/en/detail/" not in abs_url or abs_url in self._seen_details:
+            if "immovlan.be/en/detail/" not in abs_url:
                 continue
-            self._seen_details.add(abs_url)
-            self.metrics["detail_links_found"] += 1
-            self.metrics["detail_requests_sent"] += 1
-            yield scrapy.Request(abs_url, callback=self.parse_detail_static_first, dont_filter=True)
+            sent += 1
+            yield scrapy.Request(abs_url, callback=self.parse_detail_static_first)
+        # Update the shared counters once per listing page, not once per link
+        self.metrics["detail_links_found"] += sent
+        self.metrics["detail_requests_sent"] += sent
+
+        page = response.meta.get("page", 1)
+        if detail_paths and page < self.max_pages:
+            yield self._listing_request(municipal, page + 1)
 
     # ------------ detail pages ------------
     def parse_detail_static_first(self, response):
-        has_financial = bool(response.css("div.financial"))
-        has_general = bool(response.css("div.general-info"))
-
-        if has_financial and has_general:
-            yield from self._extract_item(response)
+        item = self._extract_item(response)
+        if item is not None:
+            yield item
         else:
             yield scrapy.Request(
                 response.url,
@@ -176,7 +280,7 @@ class ImmovlanHousesByMunicipalitySpider(scrapy.Spider):
                 dont_filter=True,
                 meta={
                     "playwright": True,
-                    "playwright_include_page": True,
+                    "playwright_context": "default",
                     "playwright_page_methods": [
                         PageMethod("wait_for_load_state", "domcontentloaded"),
                         PageMethod(
@@ -186,57 +290,76 @@ class ImmovlanHousesByMunicipalitySpider(scrapy.Spider):
                                 if (btn) btn.click();
                             }""",
                         ),
-                        PageMethod("wait_for_timeout", 500),
+                        PageMethod(wait_for_detail_sections),
                     ],
                 },
             )
 
     def parse_detail_rendered(self, response):
-        has_financial = bool(response.css("div.financial"))
-        has_general = bool(response.css("div.general-info"))
-        if not (has_financial and has_general):
-            return
-        yield from self._extract_item(response)
+        item = self._extract_item(response)
+        if item is not None:
+            yield item
 
     # ------------ extraction ------------
     def _extract_item(self, response):
+        # Without both class names in the raw bytes the sections cannot exist,
+        # so skip building the lxml tree for pages that need rendering anyway
+        body = response.body
+        if b"financial" not in body or b"general-info" not in body:
+            return None
+
+        # Look each section up once; None means the page still needs rendering
+        root = response.selector.root
+        financial = FINANCIAL_SECTION_XPATH(root)
+        general = GENERAL_SECTION_XPATH(root)
+        if not (financial and general):
+            return None
+
         item = PropertyItem()
         item["url"] = response.url
 
-        parts = response.url.strip("/").split("/")
-        item["municipality_url"] = parts[-2] if len(parts) > 1 else ""
-        item["property_id"] = parts[-1].upper()
-
-        for li in response.css("div.financial li"):
-            label = li.css("strong::text").get()
-            value_full = li.xpath("normalize-space(string())").get()
-            if not label:
-                continue
-            value = value_full.replace(label, "").replace(":", "").strip()
-            item[self._norm(label)] = self._clean(value)
-
-        for block in response.css("div.general-info div.data-row div.data-row-wrapper > div"):
-            label = block.css("h4::text").get()
-            value = block.css("p::text").get()
-            if label and value:
+        rest, _, property_id = response.url.strip("/").rpartition("/")
+        item["municipality_url"] = rest.rpartition("/")[2]
+        item["property_id"] = property_id.upper()
+
+        # Rows are searched inside the sections found above, not the whole tree
+        for section in financial:
+            for li in FINANCIAL_ROWS_XPATH(section):
+                label = self._first(FINANCIAL_LABEL_XPATH(li))
+                if not label:
+                    continue
+                value = ROW_TEXT_XPATH(li).replace(label, "").replace(":", "").strip()
                 item[self._norm(label)] = self._clean(value)
 
-        price_text = response.css("div.detail-price::text").get()
+        for section in general:
+            for block in GENERAL_ROWS_XPATH(section):
+                label = self._first(GENERAL_LABEL_XPATH(block))
+                value = self._first(GENERAL_VALUE_XPATH(block))
+                if label and value:
+                    item[self._norm(label)] = self._clean(value)
+
+        price_text = self._first(PRICE_XPATH(root))
         if price_text:
             item.setdefault("price", self._clean(price_text))
 
-        title_text = response.css("div.detail-title h1::text").get()
+        title_text = self._first(TITLE_XPATH(root))
         if title_text:
             item.setdefault("property_type", self._clean(title_text))
 
         self.metrics["items_exported"] += 1
         if self.metrics["items_exported"] % 500 == 0:
             self.logger.info(f"Exported {self.metrics['items_exported']} items so far...")
-        yield item
+        return item
 
     # ------------ utils ------------
+    def _first(self, results):
+        return results[0] if results else None
+
     def _clean(self, text: str) -> str:
-        return re.sub(r"\s+", " ", text.strip()) if text else ""
+        return " ".join(text.split()) if text else ""
 
     def _norm(self, label: str) -> str:
-        return re.sub(r"[^a-z0-9]+", "_", label.lower().strip()) if label else ""
+        key = self._norm_cache.get(label)
+        if key is None:
+            key = self._norm_cache[label] = NON_ALNUM_RE.sub("_", label.lower().strip()) if label else ""
+        return key
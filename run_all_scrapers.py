@@ -1,8 +1,14 @@
+import csv
+import os
 import subprocess
-import pandas as pd
 import time
 import json
+from operator import itemgetter
 from pathlib import Path
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from twisted.internet import defer
 
 # === CONFIG ===
 PROJECT_DIR = Path(__file__).resolve().parent
@@ -24,67 +30,145 @@ APARTMENTS_COMBINED = DATA_DIR / "immo_apartments_combined.csv"
 HOUSES_COMBINED = DATA_DIR / "immo_houses_combined.csv"
 ALL_COMBINED = DATA_DIR / "immo_all_properties.csv"
 
+# Strings pd.read_csv reads as missing; they are written back as empty cells
+NA_VALUES = frozenset({
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+})
 
-# === 1. Run spiders sequentially with log files ===
-def run_spider(spider_name):
-    log_path = LOG_DIR / f"{spider_name}.log"
-    print(f"\n🚀 Starting spider: {spider_name}")
-    start = time.time()
 
-    with open(log_path, "w", encoding="utf-8") as log_file:
-        process = subprocess.run(
-            ["scrapy", "crawl", spider_name],
-            stdout=log_file,
-            stderr=subprocess.STDOUT,
-            cwd=PROJECT_DIR,
-            text=True,
-        )
+# === 1. Run spiders sequentially in one Scrapy process, with log files ===
+def track_duration(crawler, spider_name, durations):
+    """Record each spider's runtime, from spider_opened to spider_closed."""
+    started = {}
 
-    elapsed = round(time.time() - start, 2)
-    print(f"✅ Finished {spider_name} in {elapsed}s — log saved to {log_path}")
-    return elapsed
+    def opened(spider):
+        print(f"\n🚀 Started spider: {spider_name}")
+        started["t"] = time.time()
+
+    def closed(spider):
+        elapsed = round(time.time() - started.get("t", total_start), 2)
+        durations[spider_name] = elapsed
+        print(f"✅ Finished {spider_name} in {elapsed}s — log saved to {LOG_DIR / f'{spider_name}.log'}")
+
+    # The handlers are closures, so keep strong references to them
+    crawler.signals.connect(opened, signal=signals.spider_opened, weak=False)
+    crawler.signals.connect(closed, signal=signals.spider_closed, weak=False)
+
+
+@defer.inlineCallbacks
+def crawl_sequentially(process, durations):
+    """Run the spiders one after another, so immovlan.be only ever sees one crawl at a time."""
+    for spider in SPIDERS:
+        # A new crawler points Scrapy's root log handler at its own LOG_FILE
+        process.settings.set("LOG_FILE", str(LOG_DIR / f"{spider}.log"))
+        crawler = process.create_crawler(spider)
+        track_duration(crawler, spider, durations)
+        try:
+            yield process.crawl(crawler)
+        except Exception as e:
+            # Move on to the next spider, as the one-subprocess-per-spider loop did
+            print(f"⚠️ Spider {spider} failed: {e!r}")
 
 
 total_start = time.time()
 durations = {}
 
-for spider in SPIDERS:
-    durations[spider] = run_spider(spider)
+# The spiders share one reactor instead of paying the interpreter and Twisted
+# start-up once per `scrapy crawl` subprocess; start() stops it once the chain is done
+os.chdir(PROJECT_DIR)
+process = CrawlerProcess(get_project_settings())
+crawl_sequentially(process, durations)
+process.start()
 
 
 # === 2. Combine CSVs ===
+def stream_concat_csvs(csv_files, output_path, add_source=True):
+    """
+    Append the rows of csv_files into one CSV under the union of their headers.
+
+    Headers are read first, then rows are copied one file at a time, so memory
+    stays flat however large the crawl. Columns a file lacks are left empty,
+    as are values pandas would read as missing, such as 'None'.
+    Returns the number of rows written, or None if no file could be read.
+    """
+    headers = {}
+    for f in csv_files:
+        try:
+            with open(f, newline="", encoding="utf-8") as fh:
+                headers[f] = next(csv.reader(fh), [])
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"⚠️ Failed to read {f}: {e}")
+    if not headers:
+        return None
+
+    # Union of the headers in first-seen order, as pd.concat would build it
+    columns = {}
+    for header in headers.values():
+        columns.update(dict.fromkeys(header))
+        if add_source:
+            columns["source_file"] = None
+    columns = list(columns)
+
+    # Written aside and swapped in, so a failed run never leaves a half-written output
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    rows = 0
+    with open(tmp_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as out:
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for f, header in headers.items():
+            width = len(header)
+            # Each row gets [source file, ""] appended; missing columns read the ""
+            index = {col: i for i, col in enumerate(header)}
+            if add_source:
+                index["source_file"] = width
+            positions = [index.get(col, width + 1) for col in columns]
+            # itemgetter returns a bare value rather than a tuple for a single index
+            pick = itemgetter(*positions) if len(positions) > 1 else lambda row: [row[i] for i in positions]
+            start = out.tell()
+            file_rows = 0
+            try:
+                with open(f, newline="", encoding="utf-8") as fh:
+                    reader = csv.reader(fh)
+                    next(reader, None)
+                    for row in reader:
+                        if len(row) != width:
+                            row = (row + [""] * width)[:width]
+                        row += (f.name, "")
+                        writer.writerow(["" if value in NA_VALUES else value for value in pick(row)])
+                        file_rows += 1
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                # Skip the whole file, as when its header cannot be read
+                print(f"⚠️ Failed to read {f}: {e}")
+                out.seek(start)
+                out.truncate()
+                continue
+            rows += file_rows
+    os.replace(tmp_path, output_path)
+    return rows
+
+
 def combine_csvs(keyword, output_path):
     print(f"\n📦 Combining CSVs for '{keyword}' ...")
-    csv_files = list(DATA_DIR.glob(f"*{keyword}*.csv"))
+    # Skip the output itself, left over from an earlier run
+    csv_files = [f for f in DATA_DIR.glob(f"*{keyword}*.csv") if f != output_path]
     if not csv_files:
         print(f"⚠️ No CSV files found for {keyword}")
         return None
 
-    dfs = []
-    for f in csv_files:
-        try:
-            df = pd.read_csv(f)
-            df["source_file"] = f.name
-            dfs.append(df)
-        except Exception as e:
-            print(f"⚠️ Failed to read {f}: {e}")
-
-    if not dfs:
+    rows = stream_concat_csvs(csv_files, output_path)
+    if rows is None:
         print(f"⚠️ No valid CSVs for {keyword}")
         return None
-
-    combined_df = pd.concat(dfs, ignore_index=True)
-    combined_df.to_csv(output_path, index=False)
-    print(f"✅ Saved → {output_path} ({len(combined_df)} rows)")
-    return combined_df
+    print(f"✅ Saved → {output_path} ({rows} rows)")
+    return rows
 
 
-apartments_df = combine_csvs("apartment", APARTMENTS_COMBINED)
-houses_df = combine_csvs("house", HOUSES_COMBINED)
+apartment_rows = combine_csvs("apartment", APARTMENTS_COMBINED)
+house_rows = combine_csvs("house", HOUSES_COMBINED)
 
-if apartments_df is not None and houses_df is not None:
-    all_combined = pd.concat([apartments_df, houses_df], ignore_index=True)
-    all_combined.to_csv(ALL_COMBINED, index=False)
+if apartment_rows is not None and house_rows is not None:
+    stream_concat_csvs([APARTMENTS_COMBINED, HOUSES_COMBINED], ALL_COMBINED, add_source=False)
     print(f"✅ Final merged CSV → {ALL_COMBINED}")
 else:
     print("⚠️ Skipped full merge due to missing data.")
@@ -101,10 +185,11 @@ print(f"✅ Data cleaning completed in {clean_elapsed}s.")
 # === 4. Log runtime metrics ===
 total_elapsed = round(time.time() - total_start, 2)
 log_path = DATA_DIR / "run_all_metrics.json"
-with open(log_path, "w", encoding="utf-8") as f:
-    json.dump(
+tmp_path = log_path.with_suffix(".json.tmp")
+with open(tmp_path, "w", encoding="utf-8") as f:
+    f.write(json.dumps(
         {"total_runtime_s": total_elapsed, "durations": durations, "clean_time_s": clean_elapsed},
-        f,
         indent=2,
-    )
+    ))
+os.replace(tmp_path, log_path)
 print(f"\n📊 Metrics saved → {log_path}")
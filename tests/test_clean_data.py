@@ -0,0 +1,53 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from clean_data import combine_csv_files
+
+
+class CombineCsvFilesTest(unittest.TestCase):
+    def combine(self, houses, apartments):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, name) for name in ('houses.csv', 'apartments.csv', 'out.csv')]
+            pd.DataFrame(houses).to_csv(paths[0], index=False)
+            pd.DataFrame(apartments).to_csv(paths[1], index=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                combined = combine_csv_files(*paths, type1_name='house', type2_name='apartment')
+            return combined.set_index('property_id')
+
+    def test_merges_int_column_with_float_column(self):
+        combined = self.combine(
+            {'property_id': [1, 2], 'rooms': [3, 4]},
+            {'property_id': [2, 3], 'rooms': [2.5, 1.5]},
+        )
+        self.assertEqual(combined.loc[1, 'rooms'], 3)
+        self.assertEqual(combined.loc[2, 'rooms'], 4)
+        self.assertEqual(combined.loc[3, 'rooms'], 1.5)
+
+    def test_merges_int_column_with_text_column(self):
+        combined = self.combine(
+            {'property_id': [1, 2], 'price': [250000, 300000]},
+            {'property_id': [2, 3], 'price': ['On request', 'On request']},
+        )
+        self.assertEqual(combined.loc[1, 'price'], 250000)
+        self.assertEqual(combined.loc[2, 'price'], 300000)
+        self.assertEqual(combined.loc[3, 'price'], 'On request')
+
+    def test_keeps_int_column_found_in_one_file_as_int(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, name) for name in ('houses.csv', 'apartments.csv', 'out.csv')]
+            pd.DataFrame({'property_id': [1, 2, 3], 'rooms': [1, 2, 3]}).to_csv(paths[0], index=False)
+            pd.DataFrame({'property_id': [3, 4], 'lift': [1, 0]}).to_csv(paths[1], index=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                combine_csv_files(*paths, type1_name='house', type2_name='apartment')
+            written = pd.read_csv(paths[2], dtype=str, keep_default_na=False).set_index('property_id')
+        self.assertEqual(written.loc[['1', '2', '3', '4'], 'rooms'].tolist(), ['1', '2', '3', ''])
+        self.assertEqual(written.loc[['3', '4'], 'lift'].tolist(), ['1', '0'])
+
+
+if __name__ == '__main__':
+    unittest.main()